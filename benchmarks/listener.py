@@ -0,0 +1,146 @@
+"""
+benchmarks.listener
+~~~~~~~~~~~~~~~~~~~
+
+Micro-benchmark of events per second through the watchdog listeners.
+
+Feeds synthetic file events through EventListener, and through the
+single-file listeners for many file entries, comparing the current
+listeners with the previous per-event relpath/abspath implementation.
+
+Usage: PYTHONPATH=. python benchmarks/listener.py [<events>] [<files>]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+from watchdog.events import (
+    FileSystemEventHandler, FileModifiedEvent, FileMovedEvent)
+
+from pytest_watch.constants import ALL_EXTENSIONS, DEFAULT_EXTENSIONS
+from pytest_watch.watcher import (
+    WATCHED_EVENTS, EventListener, EventSingleFileListener,
+    _group_by_directory)
+
+
+class LegacySingleFileListener(FileSystemEventHandler):
+    """
+    The single-file listener before suffix and path precompilation.
+    """
+    def __init__(self, path, event_queue=None):
+        super(LegacySingleFileListener, self).__init__()
+        self.event_queue = event_queue or Queue()
+        self.path = path
+
+    def on_any_event(self, event):
+        if not isinstance(event, WATCHED_EVENTS):
+            return
+
+        dest_path = None
+        if isinstance(event, FileMovedEvent):
+            dest_path = os.path.relpath(event.dest_path)
+        src_path = os.path.relpath(event.src_path)
+
+        if os.path.abspath(src_path) != self.path:
+            return
+        if dest_path and os.path.abspath(dest_path) != self.path:
+            return
+
+        self.event_queue.put((type(event), src_path, dest_path))
+
+
+class LegacyListener(FileSystemEventHandler):
+    """
+    The directory listener before suffix and path precompilation.
+    """
+    def __init__(self, extensions=[], event_queue=None):
+        super(LegacyListener, self).__init__()
+        self.event_queue = event_queue or Queue()
+        self.extensions = extensions or DEFAULT_EXTENSIONS
+
+    def on_any_event(self, event):
+        if not isinstance(event, WATCHED_EVENTS):
+            return
+
+        src_path = os.path.relpath(event.src_path)
+        dest_path = None
+        if isinstance(event, FileMovedEvent):
+            dest_path = os.path.relpath(event.dest_path)
+
+        if not event.is_directory and self.extensions != ALL_EXTENSIONS:
+            src_ext = os.path.splitext(src_path)[1].lower()
+            src_included = src_ext in self.extensions
+            dest_included = False
+            if dest_path:
+                dest_ext = os.path.splitext(dest_path)[1].lower()
+                dest_included = dest_ext in self.extensions
+            if not src_included and not dest_included:
+                return
+
+        self.event_queue.put((type(event), src_path, dest_path))
+
+
+def _make_events(directory, count):
+    extensions = ['.py', '.pyc', '.txt', '.cfg', '.PY']
+    return [FileModifiedEvent(os.path.join(
+                directory, 'module_{}{}'.format(i, extensions[i % 5])))
+            for i in range(count)]
+
+
+def _events_per_second(handlers, events):
+    start = time.time()
+    for event in events:
+        # Dispatch the way the observer does for handlers on one watch
+        for handler in handlers:
+            handler.on_any_event(event)
+    elapsed = time.time() - start
+    return len(events) / elapsed if elapsed else float('inf')
+
+
+def _report(name, before, after):
+    print('{:<32} {:>12,.0f} {:>12,.0f} {:>8.1f}x'.format(
+        name, before, after, after / before))
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    event_count = int(argv[0]) if len(argv) > 0 else 100000
+    file_count = int(argv[1]) if len(argv) > 1 else 50
+
+    directory = os.path.abspath('benchmark-project')
+    events = _make_events(directory, event_count)
+    files = [os.path.join(directory, 'module_{}.py'.format(i))
+             for i in range(0, file_count * 5, 5)]
+    queue = Queue()
+
+    print('{} events, {} file entries'.format(event_count, file_count))
+    print('{:<32} {:>12} {:>12} {:>9}'.format(
+        'listener (events/s)', 'before', 'after', 'speedup'))
+
+    _report('EventListener',
+            _events_per_second([LegacyListener([], queue)], events),
+            _events_per_second([EventListener([], queue)], events))
+
+    # Fewer events, since before every file entry sees every event
+    single_file_events = events[:max(1, event_count // file_count)]
+    _report('EventSingleFileListener',
+            _events_per_second(
+                [LegacySingleFileListener(path, queue) for path in files],
+                single_file_events),
+            _events_per_second(
+                [EventSingleFileListener(paths, queue)
+                 for paths in _group_by_directory(files).values()],
+                single_file_events))
+
+
+if __name__ == '__main__':
+    main()
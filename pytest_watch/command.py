@@ -26,10 +26,16 @@ Options:
   --onfail <cmd>        Run arbitrary command on failure.
   --onexit <cmd>        Run arbitrary command when exiting pytest-watch.
   --runner <cmd>        Run a custom command instead of "py.test".
+  --fast                Run small selections (only a few test files) in a
+                        resident pytest process instead of a new subprocess.
+                        Falls back to a subprocess when a reload is unsafe.
   --pdb                 Start the interactive Python debugger on errors.
                         This also enables --wait to prevent pdb interruption.
   --spool <delay>       Re-run after a delay (in milliseconds), allowing for
                         more file system events to queue up (default: 200 ms).
+  --json-events <sock>  Stream newline-delimited JSON records of changes, runs
+                        and test results to clients of a Unix socket. Test
+                        results aren't reported when using --runner.
   -p --poll             Use polling instead of OS events (useful in VMs).
   -v --verbose          Increase verbosity of the output.
   -q --quiet            Decrease verbosity of the output (precedence over -v).
@@ -37,13 +43,15 @@ Options:
   -h --help             Print help and exit.
 """
 
+import socket
 import sys
+from copy import deepcopy
 
 import colorama
 from docopt import docopt
 
 from . import __version__
-from .config import merge_config
+from .config import CollectError, locate_config, merge_config_file
 from .constants import ALL_EXTENSIONS
 from .watcher import watch
 
@@ -52,6 +60,34 @@ doc = '\n\n\n'.join(__doc__.split('\n\n\n')[1:])
 version = 'pytest-watch ' + __version__
 
 
+def _parse_extensions(ext):
+    if ext == '*':
+        return ALL_EXTENSIONS
+    if ext:
+        return [('.' if not e.startswith('.') else '') + e
+                for e in ext.split(',')]
+    return None
+
+
+def _merge_options(cli_args, pytest_args, config_path):
+    """
+    Merges the config file options with the CLI options, returning the
+    merged args and the adjusted pytest args.
+    """
+    args = deepcopy(cli_args)
+    pytest_args = list(pytest_args)
+
+    # Merge config file options
+    if config_path:
+        merge_config_file(args, config_path)
+
+    # Adjust pytest args
+    if args['--pdb']:
+        pytest_args.append('--pdb')
+
+    return args, pytest_args
+
+
 def main(argv=None):
     """
     The entry point of the application.
@@ -79,22 +115,30 @@ def main(argv=None):
     if args['--config']:
         pytest_args.extend(['-c', args['--config']])
 
-    # Merge config file options
-    if not merge_config(args, pytest_args, verbose=args['--verbose']):
+    # Locate config file
+    try:
+        config_path = locate_config(pytest_args, verbose=args['--verbose'])
+    except (KeyboardInterrupt, CollectError):
         return 0
 
-    # Adjust pytest args
-    if args['--pdb']:
-        pytest_args.append('--pdb')
+    # Merge config file options
+    cli_args, cli_pytest_args = args, pytest_args
+    args, pytest_args = _merge_options(cli_args, cli_pytest_args, config_path)
 
     # Parse extensions
-    if args['--ext'] == '*':
-        extensions = ALL_EXTENSIONS
-    elif args['--ext']:
-        extensions = [('.' if not e.startswith('.') else '') + e
-                      for e in args['--ext'].split(',')]
-    else:
-        extensions = None
+    extensions = _parse_extensions(args['--ext'])
+
+    # Re-merge options when the config file changes
+    def reload_config():
+        args, pytest_args = _merge_options(
+            cli_args, cli_pytest_args, config_path)
+        return {
+            'ignore': args['--ignore'],
+            'extensions': _parse_extensions(args['--ext']),
+            'wait': args['--wait'] or '--pdb' in pytest_args,
+            'runner': args['--runner'],
+            'pytest_args': pytest_args,
+        }
 
     # Parse numeric arguments
     spool = args['--spool']
@@ -105,6 +149,11 @@ def main(argv=None):
             sys.stderr.write('Error: Spool must be an integer.\n')
             return 2
 
+    # Check for event stream support
+    if args['--json-events'] and not hasattr(socket, 'AF_UNIX'):
+        sys.stderr.write('Error: --json-events requires Unix sockets.\n')
+        return 2
+
     # Run pytest and watch for changes
     return watch(entries=directories,
                  ignore=args['--ignore'],
@@ -122,4 +171,8 @@ def main(argv=None):
                  poll=args['--poll'],
                  verbose=args['--verbose'],
                  quiet=args['--quiet'],
-                 pytest_args=pytest_args)
+                 pytest_args=pytest_args,
+                 fast=args['--fast'],
+                 config_path=config_path,
+                 reload_config=reload_config if config_path else None,
+                 json_events=args['--json-events'])
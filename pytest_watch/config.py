@@ -79,22 +79,26 @@ def _collect_config(pytest_args, silent=True):
     return _run_pytest_collect(pytest_args)
 
 
-def merge_config(args, pytest_args, silent=True, verbose=False):
+def locate_config(pytest_args, silent=True, verbose=False):
+    """
+    Returns the path of the pytest config file, or None if there isn't one.
+    Raises CollectError or KeyboardInterrupt if collection fails.
+    """
     if verbose:
         print('Locating inifile...')
 
-    try:
-        config_path = _collect_config(pytest_args, silent)
-    except (KeyboardInterrupt, CollectError):
-        return False
+    return _collect_config(pytest_args, silent)
 
-    if not config_path:
-        return True
 
+def merge_config_file(args, config_path):
+    """
+    Merges the [pytest-watch] options from the specified config file into
+    the CLI args, letting the CLI options take precedence.
+    """
     config = ConfigParser()
     config.read(config_path)
     if not config.has_section('pytest-watch'):
-        return True
+        return
 
     for cli_name in args:
         if not cli_name.startswith(CLI_OPTION_PREFIX):
@@ -116,5 +120,3 @@ def merge_config(args, pytest_args, silent=True, verbose=False):
             args[cli_name] = config.getboolean('pytest-watch', config_name)
         else:
             args[cli_name] = config.get('pytest-watch', config_name)
-
-    return True
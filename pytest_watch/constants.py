@@ -2,6 +2,12 @@ DEFAULT_EXTENSIONS = ['.py']
 ALL_EXTENSIONS = object()
 
 
+# Resident runner (--fast)
+FAST_MAX_ENTRIES = 5
+RELOAD_SAFE_EXTENSIONS = frozenset(['.py'])
+RELOAD_UNSAFE_NAMES = frozenset(['conftest.py'])
+
+
 # Exit codes from pytest
 # http://pytest.org/latest/_modules/_pytest/main.html
 EXIT_OK = 0
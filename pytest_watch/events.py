@@ -0,0 +1,189 @@
+import binascii
+import json
+import os
+import select
+import socket
+import stat
+import threading
+import time
+
+
+EVENTS_ENV = 'PYTEST_WATCH_EVENTS'
+EVENTS_TOKEN_ENV = 'PYTEST_WATCH_EVENTS_TOKEN'
+PLUGIN_EVENTS = frozenset(['test_result'])
+CLIENT_TIMEOUT = 0.5
+FLUSH_TIMEOUT = 1.0
+
+
+class EventStream(object):
+    """
+    Streams newline-delimited JSON records to any number of clients over a
+    local Unix socket.
+
+    The pytest plugin in the test process connects to the same socket and
+    identifies itself with a token. Only its records are relayed to the
+    other clients; anything else clients send is ignored.
+    """
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.token = binascii.hexlify(os.urandom(16)).decode('ascii')
+        self.server = None
+        # Subscribed clients, each with a lock that serializes its writes
+        self.clients = {}
+        # Clients that haven't sent their first line yet
+        self.pending = set()
+        # Plugin connections that are still relaying records
+        self.plugins = set()
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Binds the socket and starts accepting clients on a worker thread.
+        """
+        # Remove a stale socket left over from a previous session
+        if os.path.exists(self.path):
+            if not stat.S_ISSOCK(os.stat(self.path).st_mode):
+                raise ValueError('Not a socket: ' + self.path)
+            os.remove(self.path)
+
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.path)
+        self.server.listen(16)
+        _start_thread(self._accept)
+
+    def emit(self, event, **fields):
+        """
+        Sends a record for the specified event to all clients.
+        """
+        fields['event'] = event
+        fields['time'] = time.time()
+        self._send(fields)
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        """
+        Waits until the records of finished plugin connections have been
+        relayed, so they reach clients before the records that follow.
+        """
+        deadline = time.time() + timeout
+        while time.time() < deadline and self._is_relaying():
+            time.sleep(0.01)
+
+    def close(self):
+        """
+        Disconnects all clients and removes the socket.
+        """
+        if self.server is None:
+            return
+        server, self.server = self.server, None
+        try:
+            # Wake up the accepting thread
+            server.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        server.close()
+        with self.lock:
+            clients = list(self.clients) + list(self.plugins)
+            self.clients, self.pending, self.plugins = {}, set(), set()
+        for client in clients:
+            client.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _is_relaying(self):
+        with self.lock:
+            if self.plugins:
+                return True
+            sockets = list(self.pending)
+        # Connections waiting to be accepted or identified
+        if self.server is not None:
+            sockets.append(self.server)
+        try:
+            readable = select.select(sockets, [], [], 0)[0]
+        except (select.error, socket.error, ValueError):
+            return False
+        return bool(readable)
+
+    def _accept(self):
+        while self.server is not None:
+            try:
+                client, _ = self.server.accept()
+            except (socket.error, AttributeError):
+                # The server socket was closed
+                break
+            client.settimeout(CLIENT_TIMEOUT)
+            with self.lock:
+                self.clients[client] = threading.Lock()
+                self.pending.add(client)
+            _start_thread(self._relay, client)
+
+    def _relay(self, client):
+        token = self.token.encode('ascii')
+        is_plugin = None
+        buffered = b''
+        while True:
+            try:
+                data = client.recv(4096)
+            except socket.timeout:
+                continue
+            except socket.error:
+                break
+            if not data:
+                break
+            buffered += data
+            lines = buffered.split(b'\n')
+            buffered = lines.pop()
+            for line in lines:
+                if is_plugin is None:
+                    is_plugin = line == token
+                    self._identify(client, is_plugin)
+                elif is_plugin:
+                    self._relay_record(line)
+        self._drop(client)
+
+    def _identify(self, client, is_plugin):
+        with self.lock:
+            self.pending.discard(client)
+            if is_plugin:
+                # Plugins only send, so stop streaming records to them
+                self.clients.pop(client, None)
+                self.plugins.add(client)
+
+    def _relay_record(self, line):
+        try:
+            record = json.loads(line.decode('utf-8'))
+        except ValueError:
+            return
+        if (not isinstance(record, dict) or
+                record.get('event') not in PLUGIN_EVENTS):
+            return
+        self._send(record)
+
+    def _send(self, record):
+        data = (json.dumps(record) + '\n').encode('utf-8')
+        with self.lock:
+            clients = list(self.clients.items())
+        for client, lock in clients:
+            try:
+                with lock:
+                    client.sendall(data)
+            except socket.error:
+                # Drop clients that disconnected or can't keep up
+                self._drop(client)
+
+    def _drop(self, client):
+        with self.lock:
+            if client in self.clients:
+                del self.clients[client]
+            elif client in self.plugins:
+                self.plugins.remove(client)
+            else:
+                return
+            self.pending.discard(client)
+        client.close()
+
+
+def _start_thread(target, *args):
+    thread = threading.Thread(target=target, args=args)
+    thread.daemon = True
+    thread.start()
+    return thread
@@ -0,0 +1,71 @@
+"""
+pytest_watch.plugin
+~~~~~~~~~~~~~~~~~~~
+
+A pytest plugin that reports per-test results to the pytest-watch event
+stream. It's enabled through PYTEST_PLUGINS when ptw runs with
+--json-events, and does nothing otherwise.
+"""
+
+import json
+import os
+import socket
+import time
+
+from .events import EVENTS_ENV, EVENTS_TOKEN_ENV
+
+
+_connection = None
+
+
+def _send(record):
+    global _connection
+    if _connection is None:
+        return
+    record['time'] = time.time()
+    try:
+        _connection.sendall((json.dumps(record) + '\n').encode('utf-8'))
+    except socket.error:
+        # Stop reporting if the watcher went away
+        _connection.close()
+        _connection = None
+
+
+def pytest_configure(config):
+    global _connection
+    path = os.environ.get(EVENTS_ENV)
+    if not path or _connection is not None:
+        return
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+        # Identify as the plugin so the watcher relays our records
+        token = os.environ.get(EVENTS_TOKEN_ENV, '')
+        connection.sendall((token + '\n').encode('utf-8'))
+    except socket.error:
+        connection.close()
+        return
+    _connection = connection
+
+
+def pytest_runtest_logreport(report):
+    # Report the call phase, and setup or teardown only when they didn't pass
+    if report.when != 'call' and report.passed:
+        return
+    record = {
+        'event': 'test_result',
+        'nodeid': report.nodeid,
+        'when': report.when,
+        'outcome': report.outcome,
+        'duration': getattr(report, 'duration', None),
+    }
+    if report.failed:
+        record['message'] = str(report.longrepr)
+    _send(record)
+
+
+def pytest_unconfigure(config):
+    global _connection
+    if _connection is not None:
+        _connection.close()
+        _connection = None
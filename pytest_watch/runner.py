@@ -0,0 +1,292 @@
+import atexit
+import multiprocessing
+import os
+import sys
+import time
+
+from .constants import (
+    EXIT_INTERRUPTED, RELOAD_SAFE_EXTENSIONS, RELOAD_UNSAFE_NAMES)
+
+
+class ResidentRunner(object):
+    """
+    Runs pytest in a reusable child process that is fed over a local pipe.
+
+    The child keeps pytest, its plugins and any imported conftest modules
+    resident between runs. When a module under the current directory
+    changes, the project modules are unloaded so the next run imports them
+    fresh.
+    """
+    def __init__(self, env=None):
+        self.env = env
+        self.process = None
+        self.connection = None
+        # The process isn't daemonic so tests can start their own processes
+        atexit.register(self.close)
+
+    def is_alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def start(self):
+        """
+        Starts the runner process.
+        """
+        # Spawn rather than fork, since the watcher already runs threads and
+        # holds sockets that the child must not inherit
+        context = _get_context()
+        parent_connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=_serve, args=(child_connection, self.env))
+        self.process.start()
+        child_connection.close()
+        self.connection = parent_connection
+
+    def run(self, pytest_args, selection=[]):
+        """
+        Prepares and starts a run. Returns a Popen-like handle to the run,
+        or None if the changed modules can't be reloaded safely.
+        """
+        run = self.prepare(pytest_args, selection)
+        if run is not None:
+            run.start()
+        return run
+
+    def prepare(self, pytest_args, selection=[]):
+        """
+        Sends the pytest arguments to the runner process, starting it if
+        needed, and unloads the changed modules. Returns a Popen-like handle
+        to start the run with, or None if a reload would be unsafe.
+        """
+        if not self.is_alive():
+            self.close()
+            self.start()
+        try:
+            self.connection.send((list(pytest_args), list(selection)))
+            started = self.connection.recv()
+        except (EOFError, IOError, OSError):
+            started = False
+        if not started:
+            return None
+        return ResidentRun(self)
+
+    def close(self):
+        """
+        Stops the runner process, if running.
+        """
+        if self.process is None:
+            return
+        try:
+            self.connection.send(None)
+        except (EOFError, IOError, OSError):
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.connection.close()
+        self.process = None
+        self.connection = None
+
+
+class ResidentRun(object):
+    """
+    A handle to a single run in a resident runner, mirroring the parts of
+    subprocess.Popen that the watcher uses.
+    """
+    def __init__(self, runner):
+        self.runner = runner
+        self.pid = runner.process.pid
+        self.returncode = None
+
+    def start(self):
+        """
+        Starts running pytest.
+        """
+        try:
+            self.runner.connection.send(True)
+        except (EOFError, IOError, OSError):
+            # Let poll() report the dead runner process
+            pass
+
+    def poll(self):
+        if self.returncode is not None:
+            return self.returncode
+        try:
+            if self.runner.connection.poll():
+                self.returncode = self.runner.connection.recv()
+                return self.returncode
+        except (EOFError, IOError, OSError):
+            pass
+        else:
+            if self.runner.is_alive():
+                return None
+        # The runner process died, so let the next run start a new one
+        exit_code = self.runner.process.exitcode
+        self.runner.close()
+        self.returncode = exit_code if exit_code else EXIT_INTERRUPTED
+        return self.returncode
+
+    def wait(self):
+        while self.poll() is None:
+            time.sleep(0.1)
+        return self.returncode
+
+
+def _get_context():
+    try:
+        return multiprocessing.get_context('spawn')
+    except AttributeError:
+        # Python < 3.4
+        return multiprocessing
+
+
+def _normalize(path):
+    if path.endswith(('.pyc', '.pyo')):
+        path = path[:-1]
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _mtime(filename):
+    try:
+        return os.path.getmtime(filename)
+    except OSError:
+        return None
+
+
+def _library_dirs():
+    prefixes = set([sys.prefix, sys.exec_prefix,
+                    getattr(sys, 'base_prefix', sys.prefix),
+                    getattr(sys, 'real_prefix', sys.prefix)])
+    return tuple(os.path.join(_normalize(prefix), '') for prefix in prefixes)
+
+
+def _module_files(root):
+    # Skip installed packages, such as a virtualenv inside the project
+    library_dirs = _library_dirs()
+    for name, module in list(sys.modules.items()):
+        filename = getattr(module, '__file__', None)
+        if not filename:
+            continue
+        filename = _normalize(filename)
+        if filename.startswith(root) and not filename.startswith(library_dirs):
+            yield name, module, filename
+
+
+def _snapshot(root):
+    return dict((filename, _mtime(filename))
+                for name, module, filename in _module_files(root))
+
+
+def _plugin_names(pytest_args):
+    names = ['pytest_watch']
+    names.extend(os.getenv('PYTEST_PLUGINS', '').split(','))
+    for index, arg in enumerate(pytest_args):
+        if arg == '-p' and index + 1 < len(pytest_args):
+            names.append(pytest_args[index + 1])
+        elif arg.startswith('-p') and not arg.startswith('--'):
+            names.append(arg[2:])
+    return frozenset(name.strip() for name in names if name.strip())
+
+
+def _is_resident(name, filename, plugins):
+    if os.path.basename(filename) in RELOAD_UNSAFE_NAMES:
+        return True
+    return any(name == plugin or name.startswith(plugin + '.')
+               for plugin in plugins)
+
+
+def _is_reload_safe(name, filename, plugins):
+    # Conftest and plugin modules, C extensions and deleted modules need a
+    # fresh process
+    if _is_resident(name, filename, plugins):
+        return False
+    if os.path.splitext(filename)[1].lower() not in RELOAD_SAFE_EXTENSIONS:
+        return False
+    return os.path.exists(filename)
+
+
+def _unload_modules(root, mtimes, pytest_args, selection):
+    """
+    Unloads every project module under root if any of them changed since the
+    mtimes snapshot, so importers of a changed module are imported again
+    too. Conftest and plugin modules stay loaded. Returns the new snapshot,
+    or None without unloading anything if a reload would be unsafe.
+    """
+    plugins = _plugin_names(pytest_args)
+    modules = list(_module_files(root))
+    current = dict((filename, _mtime(filename))
+                   for name, module, filename in modules)
+    changed = [(name, filename) for name, module, filename in modules
+               if filename in mtimes and current[filename] != mtimes[filename]]
+    if not all(_is_reload_safe(name, filename, plugins)
+               for name, filename in changed):
+        return None
+
+    if changed:
+        for name, module, filename in modules:
+            if not _is_resident(name, filename, plugins):
+                sys.modules.pop(name, None)
+
+    # Always unload test modules so pytest imports them again with
+    # assertion rewriting
+    selection = set(map(_normalize, selection))
+    for name, module in list(sys.modules.items()):
+        filename = getattr(module, '__file__', None)
+        if filename and _normalize(filename) in selection:
+            del sys.modules[name]
+
+    return current
+
+
+def _wait_for_start(connection):
+    while True:
+        try:
+            return connection.recv()
+        except KeyboardInterrupt:
+            continue
+        except EOFError:
+            return False
+
+
+def _serve(connection, env=None):
+    if env is not None:
+        os.environ.clear()
+        os.environ.update(env)
+
+    import pytest
+
+    root = os.path.join(_normalize(os.getcwd()), '')
+    mtimes = {}
+    while True:
+        try:
+            request = connection.recv()
+        except KeyboardInterrupt:
+            # Interrupts between runs are meant for a previous run
+            continue
+        except EOFError:
+            break
+        if request is None:
+            break
+
+        pytest_args, selection = request
+        mtimes = _unload_modules(root, mtimes, pytest_args, selection)
+        if mtimes is None:
+            connection.send(False)
+            break
+        connection.send(True)
+        if not _wait_for_start(connection):
+            break
+
+        try:
+            exit_code = pytest.main(pytest_args)
+        except KeyboardInterrupt:
+            exit_code = EXIT_INTERRUPTED
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        # Add the modules that were first imported by the run
+        for filename, mtime in _snapshot(root).items():
+            mtimes.setdefault(filename, mtime)
+
+        connection.send(int(exit_code))
+    connection.close()
@@ -11,6 +11,11 @@ try:
 except ImportError:
     from Queue import Queue
 
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
 from colorama import Fore, Style
 from watchdog.events import (
     FileSystemEventHandler, FileModifiedEvent, FileCreatedEvent,
@@ -19,9 +24,12 @@ from watchdog.observers import Observer
 from watchdog.observers.polling import PollingObserver
 
 from .constants import (
-    ALL_EXTENSIONS, EXIT_NOTESTSCOLLECTED, EXIT_OK, DEFAULT_EXTENSIONS)
+    ALL_EXTENSIONS, EXIT_NOTESTSCOLLECTED, EXIT_OK, DEFAULT_EXTENSIONS,
+    FAST_MAX_ENTRIES, RELOAD_SAFE_EXTENSIONS)
+from .events import EVENTS_ENV, EVENTS_TOKEN_ENV, EventStream
 from .helpers import (
     beep, clear, dequeue_all, is_windows, samepath, send_keyboard_interrupt)
+from .runner import ResidentRunner
 
 
 EVENT_NAMES = {
@@ -36,6 +44,12 @@ VERBOSE_EVENT_NAMES = {
     FileMovedEvent: 'Moved:',
     FileDeletedEvent: 'Deleted:',
 }
+JSON_EVENT_NAMES = {
+    FileModifiedEvent: 'modified',
+    FileCreatedEvent: 'created',
+    FileMovedEvent: 'moved',
+    FileDeletedEvent: 'deleted',
+}
 WATCHED_EVENTS = tuple(EVENT_NAMES)
 STYLE_BRIGHT = Fore.WHITE + Style.NORMAL + Style.BRIGHT
 STYLE_HIGHLIGHT = Fore.CYAN + Style.NORMAL + Style.BRIGHT
@@ -43,12 +57,15 @@ STYLE_HIGHLIGHT = Fore.CYAN + Style.NORMAL + Style.BRIGHT
 
 class EventSingleFileListener(FileSystemEventHandler):
     """
-    Listens for changes to a single file and re-runs tests after each change.
+    Listens for changes to specific files in a single directory and re-runs
+    tests after each change. Accepts a single path or a list of paths.
     """
-    def __init__(self, path, event_queue=None):
+    def __init__(self, paths, event_queue=None):
         super(EventSingleFileListener, self).__init__()
         self.event_queue = event_queue or Queue()
-        self.path = path
+        if isinstance(paths, string_types):
+            paths = [paths]
+        self.paths = _normalize_paths(paths)
 
     def on_any_event(self, event):
         """
@@ -61,16 +78,16 @@ class EventSingleFileListener(FileSystemEventHandler):
 
         dest_path = None
         if isinstance(event, FileMovedEvent):
-            dest_path = os.path.relpath(event.dest_path)
-        src_path = os.path.relpath(event.src_path)
+            dest_path = event.dest_path
 
-        # Filter everything but our specific file
-        if os.path.abspath(src_path) != self.path:
-            return
-        if dest_path and os.path.abspath(dest_path) != self.path:
+        # Filter everything but our specific files, including editors that
+        # save by moving a temporary file over the original
+        if (os.path.normcase(event.src_path) not in self.paths and
+                not (dest_path and
+                     os.path.normcase(dest_path) in self.paths)):
             return
 
-        self.event_queue.put((type(event), src_path, dest_path))
+        self.event_queue.put((type(event), event.src_path, dest_path))
 
 
 class EventListener(FileSystemEventHandler):
@@ -80,7 +97,14 @@ class EventListener(FileSystemEventHandler):
     def __init__(self, extensions=[], event_queue=None):
         super(EventListener, self).__init__()
         self.event_queue = event_queue or Queue()
+        self.set_extensions(extensions)
+
+    def set_extensions(self, extensions):
+        """
+        Replaces the allowed extensions. Safe to call while observing.
+        """
         self.extensions = extensions or DEFAULT_EXTENSIONS
+        self._suffixes = _compile_extensions(self.extensions)
 
     def on_any_event(self, event):
         """
@@ -91,25 +115,60 @@ class EventListener(FileSystemEventHandler):
         if not isinstance(event, WATCHED_EVENTS):
             return
 
-        src_path = os.path.relpath(event.src_path)
+        src_path = event.src_path
         dest_path = None
         if isinstance(event, FileMovedEvent):
-            dest_path = os.path.relpath(event.dest_path)
+            dest_path = event.dest_path
 
         # Filter files that don't match the allowed extensions
-        if not event.is_directory and self.extensions != ALL_EXTENSIONS:
-            src_ext = os.path.splitext(src_path)[1].lower()
-            src_included = src_ext in self.extensions
-            dest_included = False
-            if dest_path:
-                dest_ext = os.path.splitext(dest_path)[1].lower()
-                dest_included = dest_ext in self.extensions
-            if not src_included and not dest_included:
+        if not event.is_directory and self._suffixes is not None:
+            if (not _has_suffix(src_path, self._suffixes) and
+                    not (dest_path and
+                         _has_suffix(dest_path, self._suffixes))):
                 return
 
         self.event_queue.put((type(event), src_path, dest_path))
 
 
+def _normalize_paths(paths):
+    return frozenset(os.path.normcase(os.path.abspath(path))
+                     for path in paths)
+
+
+def _compile_extensions(extensions):
+    if extensions == ALL_EXTENSIONS:
+        return None
+    return frozenset(extension.lower() for extension in extensions)
+
+
+def _has_suffix(path, suffixes):
+    return os.path.splitext(path)[1].lower() in suffixes
+
+
+def _group_by_directory(files):
+    groups = {}
+    for file in files:
+        groups.setdefault(os.path.dirname(file), []).append(file)
+    return groups
+
+
+def _has_path(events, path):
+    path = os.path.normcase(os.path.abspath(path))
+    return any(os.path.normcase(p) == path
+               for event, src, dest in events
+               for p in (src, dest) if p)
+
+
+def _relpath(path):
+    if not path:
+        return path
+    try:
+        return os.path.relpath(path)
+    except ValueError:
+        # Path is on a different drive (Windows)
+        return path
+
+
 def _get_pytest_runner(custom):
     if custom:
         return custom.split(' ')
@@ -118,6 +177,39 @@ def _get_pytest_runner(custom):
     return [sys.executable, '-m', 'pytest']
 
 
+def _get_pytest_env(event_stream, runner):
+    # Custom runners may not have pytest_watch installed, so they run
+    # without the plugin and report no per-test results
+    if not event_stream or runner:
+        return None
+    env = dict(os.environ)
+    env[EVENTS_ENV] = event_stream.path
+    env[EVENTS_TOKEN_ENV] = event_stream.token
+    plugins = [plugin for plugin in env.get('PYTEST_PLUGINS', '').split(',')
+               if plugin]
+    if 'pytest_watch.plugin' not in plugins:
+        plugins.append('pytest_watch.plugin')
+    env['PYTEST_PLUGINS'] = ','.join(plugins)
+    return env
+
+
+def _is_small_selection(files, directories, runner, pytest_args):
+    if runner or directories or '--pdb' in pytest_args:
+        return False
+    return 0 < len(files) <= FAST_MAX_ENTRIES
+
+
+def _can_reload(events):
+    for event, src, dest in events:
+        # Creations, deletions and moves change what can be imported
+        if event != FileModifiedEvent:
+            return False
+        # Changes to config files or C extensions need a fresh run
+        if os.path.splitext(src)[1].lower() not in RELOAD_SAFE_EXTENSIONS:
+            return False
+    return True
+
+
 def _reduce_events(events):
     # FUTURE: Reduce ['a -> b', 'b -> c'] renames to ['a -> c']
 
@@ -161,7 +253,8 @@ def _show_summary(argv, events, verbose=False):
         print(run_command_info)
         return
 
-    events = _reduce_events(events)
+    events = [(event, _relpath(src), _relpath(dest))
+              for event, src, dest in _reduce_events(events)]
     if verbose:
         lines = ['Changes detected:']
         m = max(map(len, map(lambda e: VERBOSE_EVENT_NAMES[e[0]], events)))
@@ -207,6 +300,34 @@ def _split_recursive(directories, ignore):
     return sorted(set(recursedirs)), sorted(set(norecursedirs))
 
 
+def _schedule_directories(observer, event_listener, directories, ignore,
+                          watches, shared=()):
+    """
+    Schedules watches for the directories, keeping the existing watches
+    that are unaffected by the ignore list. Returns the updated watches.
+
+    Watches in `shared` also serve other listeners, so only the handler
+    is removed from them instead of unscheduling the whole watch.
+    """
+    recursedirs, norecursedirs = _split_recursive(directories, ignore)
+    wanted = set([(directory, True) for directory in recursedirs] +
+                 [(directory, False) for directory in norecursedirs])
+
+    for key in list(watches):
+        if key not in wanted:
+            watch = watches.pop(key)
+            if watch in shared:
+                observer.remove_handler_for_watch(event_listener, watch)
+            else:
+                observer.unschedule(watch)
+    for key in sorted(wanted):
+        if key not in watches:
+            directory, recursive = key
+            watches[key] = observer.schedule(
+                event_listener, path=directory, recursive=recursive)
+    return watches
+
+
 def run_hook(cmd, *args):
     """
     Runs a command hook, if specified.
@@ -219,7 +340,9 @@ def run_hook(cmd, *args):
 def watch(entries=[], ignore=[], extensions=[], beep_on_failure=True,
           auto_clear=False, wait=False, beforerun=None, afterrun=None,
           onpass=None, onfail=None, onexit=None, runner=None, spool=None,
-          poll=False, verbose=False, quiet=False, pytest_args=[]):
+          poll=False, verbose=False, quiet=False, pytest_args=[],
+          fast=False, config_path=None, reload_config=None,
+          json_events=None):
     argv = _get_pytest_runner(runner) + (pytest_args or [])
 
     if not entries:
@@ -239,20 +362,38 @@ def watch(entries=[], ignore=[], extensions=[], beep_on_failure=True,
     # Setup event handler
     event_listener = EventListener(extensions)
 
+    # Setup event stream for editor integrations
+    event_stream = None
+    if json_events:
+        event_stream = EventStream(json_events)
+        event_stream.start()
+
     # Setup watchdog
     observer = PollingObserver() if poll else Observer()
-    for file in files:
+    shared_watches = set()
+    for directory, paths in sorted(_group_by_directory(files).items()):
         single_file_listener = EventSingleFileListener(
-            file, event_queue=event_listener.event_queue)
-        observer.schedule(
-            single_file_listener, path=os.path.dirname(file), recursive=False)
-    recursedirs, norecursedirs = _split_recursive(directories, ignore)
-    for directory in recursedirs:
-        observer.schedule(event_listener, path=directory, recursive=True)
-    for directory in norecursedirs:
-        observer.schedule(event_listener, path=directory, recursive=False)
+            paths, event_queue=event_listener.event_queue)
+        shared_watches.add(observer.schedule(
+            single_file_listener, path=directory, recursive=False))
+    if config_path and reload_config:
+        config_path = os.path.abspath(config_path)
+        config_listener = EventSingleFileListener(
+            [config_path], event_queue=event_listener.event_queue)
+        shared_watches.add(observer.schedule(
+            config_listener, path=os.path.dirname(config_path),
+            recursive=False))
+    watches = _schedule_directories(
+        observer, event_listener, directories, ignore, {}, shared_watches)
     observer.start()
 
+    # Setup resident runner for small selections
+    resident_runner = None
+    if fast and _is_small_selection(files, directories, runner,
+                                    pytest_args or []):
+        resident_runner = ResidentRunner(
+            env=_get_pytest_env(event_stream, runner))
+
     # Watch and run tests until interrupted by user
     events = []
     while True:
@@ -271,7 +412,24 @@ def watch(entries=[], ignore=[], extensions=[], beep_on_failure=True,
             run_hook(beforerun)
 
             # Run tests
-            p = subprocess.Popen(argv, shell=is_windows)
+            started = time.time()
+            p = None
+            if resident_runner and _can_reload(events):
+                p = resident_runner.prepare(
+                    pytest_args or [], selection=files)
+            resident = p is not None
+            if not resident and resident_runner:
+                # Discard the stale runner state after an unsafe change
+                resident_runner.close()
+            if event_stream:
+                event_stream.emit('run_started', argv=argv,
+                                  selection=files + directories,
+                                  resident=resident)
+            if resident:
+                p.start()
+            else:
+                p = subprocess.Popen(argv, shell=is_windows,
+                                     env=_get_pytest_env(event_stream, runner))
             try:
                 while True:
                     # Check for completion
@@ -280,17 +438,31 @@ def watch(entries=[], ignore=[], extensions=[], beep_on_failure=True,
                         break
                     # Interrupt the current test run on filesystem event
                     if not wait and not event_listener.event_queue.empty():
+                        if event_stream:
+                            event_stream.emit('interrupted', reason='change')
                         send_keyboard_interrupt(p)
                         exit_code = p.wait()
                         break
                     # Allow user to initiate a keyboard interrupt
                     time.sleep(0.1)
             except KeyboardInterrupt:
+                if event_stream:
+                    event_stream.emit('interrupted', reason='user')
                 # Wait for current test run cleanup
-                run_hook(afterrun, p.wait())
+                exit_code = p.wait()
+                if event_stream:
+                    event_stream.flush()
+                    event_stream.emit('run_finished', exit_code=exit_code,
+                                      duration=time.time() - started)
+                run_hook(afterrun, exit_code)
                 # Exit, since this keyboard interrupt was user-initiated
                 break
 
+            if event_stream:
+                event_stream.flush()
+                event_stream.emit('run_finished', exit_code=exit_code,
+                                  duration=time.time() - started)
+
             # Run custom command
             run_hook(afterrun, exit_code)
 
@@ -308,7 +480,39 @@ def watch(entries=[], ignore=[], extensions=[], beep_on_failure=True,
 
             # Collect events for summary of next run
             events = dequeue_all(event_listener.event_queue, spool)
+            if event_stream:
+                event_stream.emit('change', changes=[
+                    {'type': JSON_EVENT_NAMES[event], 'src': src,
+                     'dest': dest}
+                    for event, src, dest in _reduce_events(events)])
+
+            # Apply config file changes to the running session
+            if (config_path and reload_config and
+                    _has_path(events, config_path)):
+                try:
+                    options = reload_config()
+                except Exception as ex:
+                    print('Error: Could not reload config: {}'.format(ex))
+                else:
+                    runner = options['runner']
+                    pytest_args = options['pytest_args']
+                    argv = _get_pytest_runner(runner) + pytest_args
+                    wait = options['wait']
+                    event_listener.set_extensions(options['extensions'])
+                    watches = _schedule_directories(
+                        observer, event_listener, directories,
+                        options['ignore'], watches, shared_watches)
+                    use_resident_runner = fast and _is_small_selection(
+                        files, directories, runner, pytest_args)
+                    if resident_runner and not use_resident_runner:
+                        resident_runner.close()
+                        resident_runner = None
+                    elif use_resident_runner and not resident_runner:
+                        resident_runner = ResidentRunner(
+                            env=_get_pytest_env(event_stream, runner))
         except KeyboardInterrupt:
+            if event_stream:
+                event_stream.emit('interrupted', reason='user')
             break
         except Exception as ex:
             print(format_exc() if verbose else 'Error: {}'.format(ex))
@@ -318,5 +522,13 @@ def watch(entries=[], ignore=[], extensions=[], beep_on_failure=True,
     observer.stop()
     observer.join()
 
+    # Stop resident runner
+    if resident_runner:
+        resident_runner.close()
+
+    # Stop event stream
+    if event_stream:
+        event_stream.close()
+
     # Run exit script
     run_hook(onexit)
@@ -0,0 +1,78 @@
+import pytest
+
+from pytest_watch.runner import ResidentRunner
+
+
+def _write(path, source):
+    path.write(source)
+    # Bump the mtime so the change is seen on filesystems with coarse mtimes
+    path.setmtime(path.mtime() + 10)
+
+
+@pytest.fixture
+def project(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    tmpdir.mkdir('pkg').join('__init__.py').write('')
+    tmpdir.join('pkg', 'util.py').write('def value():\n    return 1\n')
+    tmpdir.join('pkg', 'api.py').write(
+        'from pkg.util import value\n\n\ndef get():\n    return value()\n')
+    tmpdir.join('conftest.py').write('')
+    tmpdir.join('test_foo.py').write(
+        'from pkg.api import get\n\n\n'
+        'def test_get():\n    assert get() == 1\n')
+    return tmpdir
+
+
+@pytest.fixture
+def runner():
+    runner = ResidentRunner()
+    yield runner
+    runner.close()
+
+
+def _run(runner, project, test_file='test_foo.py'):
+    test_file = str(project.join(test_file))
+    handle = runner.run(['-q', '-p', 'no:cacheprovider', test_file],
+                        selection=[test_file])
+    return handle.wait() if handle else None
+
+
+def test_reloads_transitive_imports(project, runner):
+    assert _run(runner, project) == 0
+
+    _write(project.join('pkg', 'util.py'), 'def value():\n    return 2\n')
+
+    assert _run(runner, project) == 1
+
+
+def test_refuses_changed_conftest(project, runner):
+    assert _run(runner, project) == 0
+
+    _write(project.join('conftest.py'), 'VALUE = 1\n')
+
+    assert _run(runner, project) is None
+
+
+def test_tests_can_start_processes(project, runner):
+    project.join('test_process.py').write(
+        'import multiprocessing\n\n\n'
+        'def test_process():\n'
+        '    process = multiprocessing.Process(target=len, args=([],))\n'
+        '    process.start()\n'
+        '    process.join()\n'
+        '    assert process.exitcode == 0\n')
+
+    assert _run(runner, project, 'test_process.py') == 0
+
+
+def test_passes_env_to_runner_process(project, monkeypatch):
+    monkeypatch.delenv('PYTEST_WATCH_TEST_ENV', raising=False)
+    project.join('test_env.py').write(
+        'import os\n\n\n'
+        'def test_env():\n'
+        '    assert os.environ["PYTEST_WATCH_TEST_ENV"] == "1"\n')
+    runner = ResidentRunner(env={'PYTEST_WATCH_TEST_ENV': '1'})
+    try:
+        assert _run(runner, project, 'test_env.py') == 0
+    finally:
+        runner.close()